@@ -0,0 +1,186 @@
+# analytics.py
+#
+# Per-room thermal model fitted from Reading history, used for optimal start
+# (turn the heat up early enough that a scheduled setpoint is reached on time).
+#
+# Model (Newton's law of cooling, one per heater mode):
+#     dT/dt = (eq - T) / tau
+# which is linear in T:  dT/dt = c0 + c1*T  with  tau = -1/c1, eq = -c0/c1.
+#
+# Fitting is ordinary least squares of finite differences dT/dt against the
+# midpoint temperature. Everything is done with NumPy over the whole history
+# at once: the per-room/per-mode sums come from np.bincount, so cost is a few
+# array passes regardless of how many rooms or years there are. The sums are
+# stored on ThermalModel, so the nightly refit only reads new readings.
+
+import math
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import String, select, type_coerce
+
+from models import db, Reading, ThermalModel
+
+# Consecutive readings further apart than this are not differenced (gaps,
+# restarts). Readings are recorded about once a minute.
+MAX_GAP_HOURS = 0.25
+
+# Anything faster than this is a sensor glitch, not the room
+MAX_RATE_C_PER_HOUR = 10.0
+
+# Need at least this many differences per mode before trusting a fit
+MIN_SAMPLES = 30
+
+# Old statistics are scaled by this on every refit so the model follows
+# seasons and changes to the house instead of averaging over its whole life
+STATS_DECAY = 0.98
+
+# Never start heating more than this long before a scheduled time
+MAX_PREHEAT_MINUTES = 180
+
+_MODES = ("cool", "heat")  # index 0 = heat off, 1 = heat on
+_STATS = ("n", "sx", "sxx", "sy", "sxy")
+
+
+def difference_sums(room, timestamps, temperature, is_on, n_rooms):
+    """
+    Least-squares sums for every (room, mode) in one pass.
+
+    room:        int array, room index 0..n_rooms-1
+    timestamps:  float array, hours
+    temperature: float array, °C
+    is_on:       bool array, heater state at each reading
+
+    Returns an array of shape (n_rooms, 2, 5) holding n, Σx, Σx², Σy, Σxy
+    with x = midpoint temperature and y = dT/dt (°C/hour).
+    """
+    order = np.lexsort((timestamps, room))
+    room = room[order]
+    t = timestamps[order]
+    temp = temperature[order]
+    on = is_on[order]
+
+    dt = np.diff(t)
+    dT = np.diff(temp)
+    valid = (room[1:] == room[:-1]) & (dt > 0) & (dt <= MAX_GAP_HOURS)
+
+    # Only divide where dt is usable (avoids warnings on zero gaps)
+    y = np.divide(dT, dt, out=np.zeros_like(dT), where=valid)
+    valid &= np.abs(y) <= MAX_RATE_C_PER_HOUR
+
+    x = ((temp[1:] + temp[:-1]) / 2)[valid]
+    y = y[valid]
+    # The heater state at the start of an interval drives that interval
+    group = (room[:-1] * 2 + on[:-1].astype(np.int64))[valid]
+
+    size = n_rooms * 2
+    sums = np.stack([
+        np.bincount(group, minlength=size).astype(float),
+        np.bincount(group, weights=x, minlength=size),
+        np.bincount(group, weights=x * x, minlength=size),
+        np.bincount(group, weights=y, minlength=size),
+        np.bincount(group, weights=x * y, minlength=size),
+    ], axis=-1)
+    return sums.reshape(n_rooms, 2, 5)
+
+
+def solve(sums):
+    """
+    (tau, eq) arrays from sums of shape (..., 5). Entries without enough
+    data, or whose fit isn't a decaying exponential, come back as NaN.
+    """
+    n, sx, sxx, sy, sxy = np.moveaxis(sums, -1, 0)
+    denom = n * sxx - sx * sx
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        c1 = (n * sxy - sx * sy) / denom
+        c0 = (sy - c1 * sx) / n
+        tau = -1.0 / c1
+        eq = c0 * tau
+
+    ok = (n >= MIN_SAMPLES) & (np.abs(denom) > 1e-9) & (c1 < 0)
+    return np.where(ok, tau, np.nan), np.where(ok, eq, np.nan)
+
+
+def _stored_sums(model):
+    return np.array([
+        [getattr(model, f"{mode}_{stat}") or 0.0 for stat in _STATS]
+        for mode in _MODES
+    ])
+
+
+def refit_thermal_models(decay=STATS_DECAY):
+    """
+    Fold readings recorded since the last refit into every room's model and
+    re-solve. The first run reads the whole history. Returns
+    {thermostat_id: ThermalModel}.
+    """
+    models = {m.thermostat_id: m for m in ThermalModel.query.all()}
+    watermark = min((m.last_reading_id or 0 for m in models.values()), default=0)
+
+    # Core query, timestamps left as text: building millions of ORM rows and
+    # datetime objects costs far more than the fit. NumPy parses the ISO text.
+    rows = db.session.connection().execute(
+        select(
+            Reading.id, Reading.thermostat_id, type_coerce(Reading.timestamp, String),
+            Reading.temperature, Reading.is_on,
+        ).where(Reading.id > watermark)
+    ).fetchall()
+    if not rows:
+        return models
+
+    ids, thermo_ids, stamps, temps, on = zip(*rows)
+    ids = np.asarray(ids, dtype=np.int64)
+    thermo_ids = np.asarray(thermo_ids, dtype=np.int64)
+    hours = np.asarray(stamps, dtype="datetime64[us]").astype(np.int64) / 3.6e9
+    temps = np.asarray(temps, dtype=float)
+    on = np.asarray(on, dtype=bool)
+
+    room_ids, room = np.unique(thermo_ids, return_inverse=True)
+    new_sums = difference_sums(room, hours, temps, on, len(room_ids))
+    # Reading ids are global, so one watermark covers every room
+    last_id = int(ids.max())
+
+    now = datetime.utcnow()
+    for i, thermo_id in enumerate(room_ids.tolist()):
+        model = models.get(thermo_id)
+        if model is None:
+            model = ThermalModel(thermostat_id=thermo_id)
+            db.session.add(model)
+            models[thermo_id] = model
+
+        sums = _stored_sums(model) * decay + new_sums[i]
+        tau, eq = solve(sums)
+
+        for m, mode in enumerate(_MODES):
+            for s, stat in enumerate(_STATS):
+                setattr(model, f"{mode}_{stat}", float(sums[m, s]))
+            # Keep the previous fit if the new data isn't conclusive
+            if not np.isnan(tau[m]):
+                setattr(model, f"tau_{mode}", float(tau[m]))
+                setattr(model, f"eq_{mode}", float(eq[m]))
+
+        model.fitted_at = now
+
+    for model in models.values():
+        model.last_reading_id = last_id
+
+    db.session.commit()
+    return models
+
+
+def preheat_minutes(model, current_temp, target, max_minutes=MAX_PREHEAT_MINUTES):
+    """
+    Minutes of heating needed to go from current_temp to target, using the
+    room's heat-on model. 0 if already warm enough or there's no model yet.
+    """
+    if model is None or model.tau_heat is None or model.eq_heat is None:
+        return 0.0
+    if current_temp is None or current_temp >= target:
+        return 0.0
+    if model.eq_heat <= target:
+        # Heater can't get there at all; start as early as we allow
+        return float(max_minutes)
+
+    hours = model.tau_heat * math.log((model.eq_heat - current_temp) / (model.eq_heat - target))
+    return min(float(max_minutes), hours * 60.0)
@@ -1,25 +1,105 @@
 # app.py
-from flask import Flask, render_template, request, redirect, jsonify
-from mqtt_bridge import MqttBridge, THERMOSTATS
+import hashlib
+import json
+import os
+from flask import (
+    Blueprint, Flask, current_app, render_template, request, redirect, jsonify
+)
+from commands import execute_plan, group_to_dict, plan_operations, save_group
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, ThermostatGroup, upgrade_schema
+from mqtt_bridge import BROKER_IP, BROKER_PORT, MqttBridge, THERMOSTATS
+from scheduler import ThermostatScheduler
 
-app = Flask(__name__)
-mqtt = MqttBridge()
+bp = Blueprint("dashboard", __name__)
 
-@app.route("/")
+
+def create_app(config=None, start_mqtt=True):
+    """
+    App factory. Starting the app never waits on the broker: the bridge loads
+    its last snapshot from the instance folder and connects in the background.
+    """
+    app = Flask(__name__)
+    if config:
+        app.config.update(config)
+    app.config.setdefault("SQLALCHEMY_DATABASE_URI", "sqlite:///thermo.db")
+    app.config.setdefault("MQTT_BROKER_IP", BROKER_IP)
+    app.config.setdefault("MQTT_BROKER_PORT", BROKER_PORT)
+    app.config.setdefault("MQTT_CLIENT_ID", "flask-dashboard")
+    app.config.setdefault("FLEET_PUBLISH", True)
+    app.config.setdefault("SCHEDULER_ENABLED", True)
+    app.config.setdefault(
+        "BRIDGE_SNAPSHOT_PATH",
+        os.path.join(app.instance_path, "bridge_snapshot.json"),
+    )
+
+    db.init_app(app)
+    with app.app_context():
+        try:
+            upgrade_schema()
+        except SQLAlchemyError as e:
+            # Don't keep the dashboard from starting; DB features fail soft
+            print("Database schema upgrade failed:", e)
+
+    bridge = MqttBridge(
+        broker_ip=app.config["MQTT_BROKER_IP"],
+        broker_port=app.config["MQTT_BROKER_PORT"],
+        snapshot_path=app.config["BRIDGE_SNAPSHOT_PATH"],
+        publish_fleet=app.config["FLEET_PUBLISH"],
+        client_id=app.config["MQTT_CLIENT_ID"],
+    )
+    if start_mqtt:
+        bridge.start()
+    app.extensions["mqtt_bridge"] = bridge
+
+    # Schedules need the bridge to publish, so they only run alongside it
+    if start_mqtt and app.config["SCHEDULER_ENABLED"]:
+        scheduler = ThermostatScheduler(app, bridge)
+        scheduler.start()
+        app.extensions["thermostat_scheduler"] = scheduler
+
+    app.register_blueprint(bp)
+    return app
+
+
+def _mqtt() -> MqttBridge:
+    return current_app.extensions["mqtt_bridge"]
+
+
+@bp.route("/")
 def index():
     return render_template("index.html", thermostats=THERMOSTATS)
 
-@app.route("/api/state")
+def _state_etag(state):
+    """
+    ETag over the fields the dashboard renders. last_seen moves with every
+    report, so hashing the whole body would never give a 304. Bodies that
+    differ elsewhere share the tag, so it is sent as a weak validator.
+    """
+    rendered = {
+        tid: [
+            entry.get("temperature"), entry.get("setpoint"), entry.get("heating"),
+            (entry.get("settings") or {}).get("presets"), entry.get("stale"),
+        ]
+        for tid, entry in state.items()
+    }
+    return hashlib.sha1(json.dumps(rendered, sort_keys=True).encode()).hexdigest()
+
+@bp.route("/api/state")
 def api_state():
-    return jsonify(mqtt.get_dashboard_state())
+    # ETag lets pollers get a bodyless 304 when nothing they show changed
+    state = _mqtt().get_dashboard_state()
+    res = jsonify(state)
+    res.set_etag(_state_etag(state), weak=True)
+    return res.make_conditional(request)
 
-@app.route("/thermostat/<thermo_id>/setpoint", methods=["POST"])
+@bp.route("/thermostat/<thermo_id>/setpoint", methods=["POST"])
 def set_setpoint(thermo_id):
     # IMPORTANT: do NOT redirect. Front-end uses fetch() and we want NO page reload.
-    mqtt.publish_setpoint(thermo_id, float(request.form["setpoint"]))
+    _mqtt().publish_setpoint(thermo_id, float(request.form["setpoint"]))
     return ("", 204)
 
-@app.route("/thermostat/<thermo_id>/settings", methods=["GET", "POST"])
+@bp.route("/thermostat/<thermo_id>/settings", methods=["GET", "POST"])
 def settings(thermo_id):
     if request.method == "POST":
         new_settings = {
@@ -32,11 +112,52 @@ def settings(thermo_id):
                 "Away": float(request.form["preset_away"]),
             }
         }
-        mqtt.publish_settings(thermo_id, new_settings)
+        _mqtt().publish_settings(thermo_id, new_settings)
         return redirect(f"/thermostat/{thermo_id}/settings")
 
-    current = mqtt.get_thermostat(thermo_id).get("settings", {})
+    current = _mqtt().get_thermostat(thermo_id).get("settings", {})
     return render_template("settings.html", thermo_id=thermo_id, settings=current)
 
+@bp.route("/api/bulk", methods=["POST"])
+def bulk():
+    """
+    Many operations in one request, e.g. whole house to Away:
+        {"operations": [{"group": "house", "preset": "Away"}]}
+    All operations are validated before anything is published.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"ok": False, "errors": ["body must be a JSON object"]}), 400
+    wait = body.get("wait", True)
+    if not isinstance(wait, bool):
+        return jsonify({"ok": False, "errors": ["wait must be true or false"]}), 400
+    plan, errors = plan_operations(body.get("operations"), _mqtt())
+    if errors:
+        return jsonify({"ok": False, "errors": errors}), 400
+
+    return jsonify(execute_plan(plan, _mqtt(), wait=wait))
+
+@bp.route("/api/groups")
+def list_groups():
+    groups = ThermostatGroup.query.order_by(ThermostatGroup.name).all()
+    return jsonify([group_to_dict(g) for g in groups])
+
+@bp.route("/api/groups/<name>", methods=["PUT", "DELETE"])
+def edit_group(name):
+    if request.method == "DELETE":
+        group = ThermostatGroup.query.filter_by(name=name).first()
+        if group is not None:
+            db.session.delete(group)
+            db.session.commit()
+        return ("", 204)
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"ok": False, "errors": ["body must be a JSON object"]}), 400
+    group, error = save_group(name, body.get("kind", "group"), body.get("ids", []))
+    if error:
+        return jsonify({"ok": False, "errors": [error]}), 400
+    return jsonify(group_to_dict(group))
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
+    create_app().run(host="0.0.0.0", port=5000)
@@ -0,0 +1,233 @@
+# commands.py
+#
+# Bulk / group commands: validate a list of operations in one pass, then
+# publish everything in one pipelined batch and report ACKs per thermostat.
+#
+# Operation format (one of ids/group, one of setpoint/preset/settings):
+#   {"ids": ["livingroom", "bedroom"], "setpoint": 20.5}
+#   {"group": "house", "preset": "Away"}
+#   {"group": "upstairs", "settings": {"hysteresis": 0.3}}
+
+import math
+import time
+
+from models import db, Thermostat, ThermostatGroup
+from mqtt_bridge import DEFAULT_SETTINGS, THERMOSTATS
+
+# Same bounds as the dashboard's setpoint input
+SETPOINT_MIN = 5.0
+SETPOINT_MAX = 35.0
+
+GROUP_KINDS = ("group", "zone")
+
+# How long a bulk request waits for PUBACKs before answering
+ACK_TIMEOUT = 2.0
+
+_ACTIONS = ("setpoint", "preset", "settings")
+# worst first: one thermostat's status is the worst of its publishes
+_STATUS_ORDER = ("error", "queued", "pending", "acked")
+
+
+def _is_number(value):
+    # JSON can carry NaN/Infinity; neither is a usable temperature
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _is_setpoint(value):
+    return _is_number(value) and SETPOINT_MIN <= value <= SETPOINT_MAX
+
+
+def known_thermostat_ids(bridge):
+    db_ids = [t.mqtt_id for t in Thermostat.query.filter(Thermostat.mqtt_id.isnot(None))]
+    return set(THERMOSTATS) | set(bridge.get_dashboard_state()) | set(db_ids)
+
+
+def group_members(name):
+    group = ThermostatGroup.query.filter_by(name=name).first()
+    if group is None:
+        return None
+    return [t.mqtt_id for t in group.thermostats if t.mqtt_id]
+
+
+def _validate_settings(settings):
+    if not isinstance(settings, dict) or not settings:
+        return "settings must be a non-empty object"
+
+    for key, value in settings.items():
+        if key == "hysteresis":
+            if not _is_number(value) or value <= 0:
+                return "hysteresis must be a positive number"
+        elif key in ("steps_on", "steps_off"):
+            if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+                return f"{key} must be a non-negative integer"
+        elif key == "presets":
+            if not isinstance(value, dict) or not all(_is_setpoint(v) for v in value.values()):
+                return f"presets must map names to setpoints between {SETPOINT_MIN} and {SETPOINT_MAX}"
+        else:
+            return f"unknown setting {key!r}"
+    return None
+
+
+def plan_operations(operations, bridge):
+    """
+    Validate every operation and resolve it to per-thermostat changes.
+
+    Returns (plan, errors). plan maps thermo_id -> {"setpoint": float,
+    "settings": dict}; when several operations hit the same thermostat the
+    later one wins, so each thermostat gets at most one publish per topic.
+    Nothing should be published unless errors is empty.
+    """
+    errors = []
+    plan = {}
+
+    if not isinstance(operations, list) or not operations:
+        return plan, ["operations must be a non-empty list"]
+
+    known = known_thermostat_ids(bridge)
+    state = bridge.get_dashboard_state()
+
+    for i, op in enumerate(operations):
+        where = f"operations[{i}]"
+        if not isinstance(op, dict):
+            errors.append(f"{where}: must be an object")
+            continue
+
+        # --- targets ---
+        if ("ids" in op) == ("group" in op):
+            errors.append(f"{where}: give exactly one of 'ids' or 'group'")
+            continue
+
+        if "group" in op:
+            ids = group_members(op["group"]) if isinstance(op["group"], str) else None
+            if ids is None:
+                errors.append(f"{where}: unknown group {op['group']!r}")
+                continue
+        else:
+            ids = op["ids"]
+            if not isinstance(ids, list) or not ids or not all(isinstance(t, str) for t in ids):
+                errors.append(f"{where}: 'ids' must be a non-empty list of thermostat ids")
+                continue
+            unknown = [t for t in ids if t not in known]
+            if unknown:
+                errors.append(f"{where}: unknown thermostat(s) {', '.join(unknown)}")
+                continue
+
+        # --- action ---
+        actions = [a for a in _ACTIONS if a in op]
+        if len(actions) != 1:
+            errors.append(f"{where}: give exactly one of 'setpoint', 'preset' or 'settings'")
+            continue
+        action = actions[0]
+
+        if action == "setpoint":
+            value = op["setpoint"]
+            if not _is_setpoint(value):
+                errors.append(f"{where}: setpoint must be between {SETPOINT_MIN} and {SETPOINT_MAX}")
+                continue
+            for tid in ids:
+                plan.setdefault(tid, {})["setpoint"] = float(value)
+
+        elif action == "preset":
+            name = op["preset"]
+            if not isinstance(name, str):
+                errors.append(f"{where}: preset must be a preset name")
+                continue
+            # Presets are per-thermostat, so "Away" can mean different temperatures
+            missing, out_of_range = [], []
+            for tid in ids:
+                settings = (state.get(tid) or {}).get("settings", DEFAULT_SETTINGS)
+                presets = settings.get("presets", {})
+                if not _is_number(presets.get(name)):
+                    missing.append(tid)
+                elif not _is_setpoint(presets[name]):
+                    # e.g. set on the thermostat itself; don't pass it on
+                    out_of_range.append(tid)
+                else:
+                    plan.setdefault(tid, {})["setpoint"] = float(presets[name])
+            if missing:
+                errors.append(f"{where}: preset {name!r} not defined for {', '.join(missing)}")
+            if out_of_range:
+                errors.append(f"{where}: preset {name!r} is outside {SETPOINT_MIN}-{SETPOINT_MAX} "
+                              f"for {', '.join(out_of_range)}")
+
+        else:
+            problem = _validate_settings(op["settings"])
+            if problem:
+                errors.append(f"{where}: {problem}")
+                continue
+            for tid in ids:
+                plan.setdefault(tid, {})["settings"] = op["settings"]
+
+    return plan, errors
+
+
+def execute_plan(plan, bridge, wait=True, timeout=ACK_TIMEOUT):
+    """
+    Publish the whole plan back-to-back (paho pipelines them on one
+    connection), then wait once for all the ACKs.
+    """
+    started = time.perf_counter()
+    sent = []  # (thermo_id, MQTTMessageInfo)
+
+    for tid, change in plan.items():
+        if "settings" in change:
+            # Partial settings are applied over what the thermostat has now
+            current = bridge.get_thermostat(tid).get("settings", {})
+            merged = {**current, **change["settings"]}
+            if "presets" in change["settings"]:
+                merged["presets"] = {**current.get("presets", {}), **change["settings"]["presets"]}
+            sent.append((tid, bridge.publish_settings(tid, merged)))
+        if "setpoint" in change:
+            sent.append((tid, bridge.publish_setpoint(tid, change["setpoint"])))
+
+    statuses = bridge.wait_for_acks([info for _, info in sent], timeout if wait else 0)
+
+    results = {tid: {**change, "status": "acked"} for tid, change in plan.items()}
+    for (tid, _), status in zip(sent, statuses):
+        if _STATUS_ORDER.index(status) < _STATUS_ORDER.index(results[tid]["status"]):
+            results[tid]["status"] = status
+
+    return {
+        "ok": all(r["status"] == "acked" for r in results.values()),
+        "published": len(sent),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        "results": results,
+    }
+
+
+def save_group(name, kind, ids):
+    """Create or replace a group. Returns (group, error)."""
+    if kind not in GROUP_KINDS:
+        return None, f"kind must be one of {', '.join(GROUP_KINDS)}"
+    if not isinstance(ids, list) or not all(isinstance(t, str) for t in ids):
+        return None, "ids must be a list of thermostat ids"
+
+    thermostats = Thermostat.query.filter(Thermostat.mqtt_id.in_(ids)).all()
+    missing = set(ids) - {t.mqtt_id for t in thermostats}
+    if missing:
+        return None, f"unknown thermostat(s) {', '.join(sorted(missing))}"
+
+    group = ThermostatGroup.query.filter_by(name=name).first()
+    if group is None:
+        group = ThermostatGroup(name=name)
+        db.session.add(group)
+    group.kind = kind
+
+    if kind == "zone":
+        # A thermostat lives in one zone: moving it here takes it out of the others
+        for thermo in thermostats:
+            for other in list(thermo.groups):
+                if other is not group and other.kind == "zone":
+                    other.thermostats.remove(thermo)
+
+    group.thermostats = thermostats
+    db.session.commit()
+    return group, None
+
+
+def group_to_dict(group):
+    return {
+        "name": group.name,
+        "kind": group.kind,
+        "ids": [t.mqtt_id for t in group.thermostats if t.mqtt_id],
+    }
@@ -0,0 +1,4 @@
+# loadtest/
+#
+# End-to-end load testing for the dashboard + MQTT bridge.
+# Run with `python -m loadtest --help`.
@@ -0,0 +1,264 @@
+# loadtest/__main__.py
+#
+# End-to-end load test: broker + simulated fleet + real dashboard process
+# + concurrent dashboard clients, repeated for growing fleet sizes.
+#
+#   python -m loadtest                          # 1, 10, 100, 1000 thermostats
+#   python -m loadtest --sizes 1,50 --clients 4 --duration 20
+#   python -m loadtest --broker 127.0.0.1:1883 --json results.json
+#
+# restart_s: with the fleet paused, the dashboard is restarted without its
+# local snapshot and timed from launch until /api/state has every node, i.e.
+# how fast a bridge catches up from the retained thermostat/_fleet/snapshot.
+# Only measured on the stand-in broker (a real broker's fleet topics are
+# never published to).
+#
+# Without --broker an in-process stand-in broker is used (see broker.py).
+# A broker on another host is refused unless --allow-remote-broker is given:
+# the run publishes retained messages, and pointing it at the broker of a
+# live installation disturbs the real thermostats' topics.
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from loadtest.broker import StandInBroker
+from loadtest.dashboard import DashboardClients, RoundTripMonitor, percentile
+from loadtest.fleet import SimulatedFleet
+from mqtt_bridge import FLEET_SNAPSHOT_TOPIC
+
+try:
+    import psutil
+except ImportError:  # optional; falls back to /proc on Linux
+    psutil = None
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BRIDGE_CLIENT_ID = "loadtest-dashboard"
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+
+class ProcessStats:
+    """CPU seconds and RSS of another process (psutil, else /proc)."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self._proc = psutil.Process(pid) if psutil else None
+
+    def cpu_seconds(self):
+        if self._proc:
+            t = self._proc.cpu_times()
+            return t.user + t.system
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        except OSError:
+            return None
+
+    def rss_bytes(self):
+        if self._proc:
+            return self._proc.memory_info().rss
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return None
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get_state(base_url):
+    with urllib.request.urlopen(f"{base_url}/api/state", timeout=5) as res:
+        return json.loads(res.read())
+
+
+def _wait_for(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if predicate():
+                return True
+        except OSError:
+            pass
+        time.sleep(0.1)
+    return False
+
+
+def _start_server(args, broker_host, broker_port, work_dir, snapshot_name):
+    port = _free_port()
+    command = [
+        sys.executable, "-m", "loadtest.server",
+        "--broker-host", broker_host, "--broker-port", str(broker_port),
+        "--port", str(port), "--client-id", BRIDGE_CLIENT_ID,
+        "--snapshot", os.path.join(work_dir, snapshot_name),
+        "--db", os.path.join(work_dir, "thermo.db"),
+    ]
+    if args.broker:
+        # Never overwrite a real broker's retained fleet snapshot
+        command.append("--no-fleet-publish")
+    server = subprocess.Popen(command, cwd=REPO_ROOT, stdout=subprocess.DEVNULL)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def _stop_server(server):
+    server.terminate()
+    server.wait(timeout=10)
+
+
+def _has_fleet(base_url, ids):
+    state = _get_state(base_url)
+    return all(state.get(tid, {}).get("temperature") is not None for tid in ids)
+
+
+def _retained_has_fleet(broker, ids):
+    payload = broker.retained.get(FLEET_SNAPSHOT_TOPIC)
+    return payload is not None and ids <= set(json.loads(payload).get("thermostats", {}))
+
+
+def run_step(args, size):
+    broker = None
+    if args.broker:
+        host, _, port = args.broker.partition(":")
+        broker_host, broker_port = host, int(port or 1883)
+    else:
+        broker = StandInBroker().start()
+        broker_host, broker_port = broker.host, broker.port
+
+    # Fresh snapshot and database per run: a previous run's fleet doesn't
+    # leak in, and the repo's instance/thermo.db is never touched
+    work_dir = tempfile.TemporaryDirectory(prefix="thermo-loadtest-")
+    server, base_url = _start_server(args, broker_host, broker_port, work_dir.name, "first.json")
+    fleet = monitor = clients = None
+
+    try:
+        if not _wait_for(lambda: _get_state(base_url) is not None, 15):
+            raise RuntimeError("dashboard server did not come up")
+
+        monitor = RoundTripMonitor(broker_host, broker_port)
+        fleet = SimulatedFleet(broker_host, broker_port, size, interval=args.interval).start()
+        ids = set(fleet.thermostats)
+        if not _wait_for(lambda: _has_fleet(base_url, ids), args.interval * 2 + 10):
+            raise RuntimeError("dashboard never saw the whole fleet")
+
+        restart = None
+        if broker and _wait_for(lambda: _retained_has_fleet(broker, ids), 15):
+            fleet.pause()
+            _stop_server(server)
+            t0 = time.perf_counter()
+            server, base_url = _start_server(args, broker_host, broker_port, work_dir.name, "restart.json")
+            if _wait_for(lambda: _has_fleet(base_url, ids), 30):
+                restart = time.perf_counter() - t0
+            fleet.resume()
+        stats = ProcessStats(server.pid)
+
+        clients = DashboardClients(base_url, args.clients, ids, monitor=monitor,
+                                   setpoint_every=args.setpoint_every).start()
+
+        published0 = fleet.published
+        delivered0 = broker.delivered[BRIDGE_CLIENT_ID] if broker else None
+        cpu0 = stats.cpu_seconds()
+        w0 = time.perf_counter()
+
+        time.sleep(args.duration)
+
+        window = time.perf_counter() - w0
+        cpu1 = stats.cpu_seconds()
+        rss = stats.rss_bytes()
+        published = fleet.published - published0
+        delivered = broker.delivered[BRIDGE_CLIENT_ID] - delivered0 if broker else None
+    finally:
+        if clients:
+            clients.stop()
+        if fleet:
+            if args.broker:
+                fleet.clear_retained()
+            fleet.stop()
+        if monitor:
+            monitor.stop()
+        _stop_server(server)
+        work_dir.cleanup()
+        if broker:
+            broker.stop()
+
+    def ms(v):
+        return None if v is None else round(v * 1000, 2)
+
+    return {
+        "thermostats": size,
+        "restart_s": None if restart is None else round(restart, 3),
+        "fleet_msgs_per_s": round(published / window, 1),
+        "bridge_msgs_per_s": None if delivered is None else round(delivered / window, 1),
+        "bridge_cpu_pct": None if cpu0 is None or cpu1 is None else round((cpu1 - cpu0) / window * 100, 1),
+        "bridge_rss_mb": None if rss is None else round(rss / 1024 / 1024, 1),
+        "state_p50_ms": ms(percentile(clients.state_latencies, 50)),
+        "state_p99_ms": ms(percentile(clients.state_latencies, 99)),
+        "setpoint_p50_ms": ms(percentile(clients.setpoint_latencies, 50)),
+        "setpoint_p99_ms": ms(percentile(clients.setpoint_latencies, 99)),
+        "echo_p50_ms": ms(percentile(monitor.latencies, 50)),
+        "echo_p99_ms": ms(percentile(monitor.latencies, 99)),
+        "echo_samples": len(monitor.latencies),
+        "echo_lost": monitor.lost,
+        "http_errors": clients.errors,
+    }
+
+
+def print_table(results):
+    columns = list(results[0].keys())
+    widths = [max(len(c), *(len(str(r[c])) for r in results)) for c in columns]
+    print("  ".join(c.rjust(w) for c, w in zip(columns, widths)))
+    for r in results:
+        print("  ".join(str(r[c]).rjust(w) for c, w in zip(columns, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Thermostat fleet load test")
+    parser.add_argument("--sizes", default="1,10,100,1000",
+                        help="comma-separated fleet sizes to run")
+    parser.add_argument("--clients", type=int, default=8,
+                        help="concurrent dashboard clients")
+    parser.add_argument("--duration", type=float, default=30.0,
+                        help="measurement window per fleet size (seconds)")
+    parser.add_argument("--interval", type=float, default=5.0,
+                        help="publish period of each simulated node (seconds)")
+    parser.add_argument("--setpoint-every", type=int, default=2,
+                        help="each client POSTs a setpoint every N polls (0 = never); "
+                             "p99 columns stay empty below 100 samples")
+    parser.add_argument("--broker", default=None,
+                        help="host[:port] of a real broker (default: in-process stand-in)")
+    parser.add_argument("--allow-remote-broker", action="store_true",
+                        help="allow --broker on another host (never a live installation's broker)")
+    parser.add_argument("--json", default=None, help="also write results to this file")
+    args = parser.parse_args()
+
+    if args.broker and args.broker.partition(":")[0] not in LOCAL_HOSTS and not args.allow_remote_broker:
+        parser.error("--broker is not on this machine; pass --allow-remote-broker "
+                     "if it's a dedicated test broker")
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        print(f"Running fleet of {size}…", flush=True)
+        results.append(run_step(args, size))
+
+    print()
+    print_table(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
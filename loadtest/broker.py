@@ -0,0 +1,268 @@
+# loadtest/broker.py
+#
+# Minimal in-process MQTT 3.1.1 broker, good enough to stand in for
+# Mosquitto during load tests:
+#   - CONNECT / SUBSCRIBE / UNSUBSCRIBE / PUBLISH / PINGREQ / DISCONNECT
+#   - '+' and '#' wildcards
+#   - retained messages
+#   - QoS 1/2 publishes are acknowledged; delivery to subscribers is QoS 0
+#
+# No auth, no sessions, no will messages. Don't point real thermostats at it.
+
+import asyncio
+import threading
+from collections import defaultdict
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+PUBREC = 5
+PUBREL = 6
+PUBCOMP = 7
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    p_parts = pattern.split("/")
+    t_parts = topic.split("/")
+
+    for i, p in enumerate(p_parts):
+        if p == "#":
+            return True
+        if i >= len(t_parts):
+            return False
+        if p != "+" and p != t_parts[i]:
+            return False
+
+    return len(p_parts) == len(t_parts)
+
+
+def _encode_length(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = n % 128
+        n //= 128
+        if n:
+            byte |= 0x80
+        out.append(byte)
+        if not n:
+            return bytes(out)
+
+
+def _encode_str(s: str) -> bytes:
+    raw = s.encode()
+    return len(raw).to_bytes(2, "big") + raw
+
+
+def _packet(first_byte: int, body: bytes) -> bytes:
+    return bytes([first_byte]) + _encode_length(len(body)) + body
+
+
+def _publish_packet(topic: str, payload: bytes, retain: bool) -> bytes:
+    return _packet((PUBLISH << 4) | (1 if retain else 0), _encode_str(topic) + payload)
+
+
+class _Session:
+    def __init__(self, writer):
+        self.writer = writer
+        self.client_id = None
+        self.subscriptions = set()
+
+
+def _is_wildcard(pattern: str) -> bool:
+    return "+" in pattern or "#" in pattern
+
+
+class StandInBroker:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+
+        self.sessions = set()
+        self.retained = {}
+
+        # Exact-topic subscriptions are looked up by dict; only wildcard
+        # patterns are matched one by one on each publish.
+        self._exact = defaultdict(set)     # topic -> sessions
+        self._wildcard = defaultdict(set)  # pattern -> sessions
+
+        # counters (read by the load test runner)
+        self.received = 0
+        self.delivered = defaultdict(int)  # client_id -> messages delivered
+
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    # ---------------- lifecycle ----------------
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="standin-broker", daemon=True)
+        self._thread.start()
+        if not self._ready.wait(5):
+            raise RuntimeError("stand-in broker failed to start")
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle, self.host, self.port)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            for session in list(self.sessions):
+                session.writer.close()
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+    # ---------------- protocol ----------------
+
+    async def _read_packet(self, reader):
+        header = await reader.readexactly(1)
+        multiplier = 1
+        length = 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        body = await reader.readexactly(length) if length else b""
+        return header[0], body
+
+    async def _handle(self, reader, writer):
+        session = _Session(writer)
+        self.sessions.add(session)
+        try:
+            while True:
+                first, body = await self._read_packet(reader)
+                ptype = first >> 4
+
+                if ptype == CONNECT:
+                    # protocol name, level, flags, keepalive, then client id
+                    name_len = int.from_bytes(body[0:2], "big")
+                    pos = 2 + name_len + 4
+                    id_len = int.from_bytes(body[pos:pos + 2], "big")
+                    session.client_id = body[pos + 2:pos + 2 + id_len].decode()
+                    writer.write(_packet(CONNACK << 4, b"\x00\x00"))
+
+                elif ptype == PUBLISH:
+                    self._on_publish(session, first, body)
+
+                elif ptype == PUBREL:
+                    writer.write(_packet(PUBCOMP << 4, body[:2]))
+
+                elif ptype == SUBSCRIBE:
+                    self._on_subscribe(session, body)
+
+                elif ptype == UNSUBSCRIBE:
+                    pos = 2
+                    while pos < len(body):
+                        n = int.from_bytes(body[pos:pos + 2], "big")
+                        self._unsubscribe(session, body[pos + 2:pos + 2 + n].decode())
+                        pos += 2 + n
+                    writer.write(_packet(UNSUBACK << 4, body[:2]))
+
+                elif ptype == PINGREQ:
+                    writer.write(_packet(PINGRESP << 4, b""))
+
+                elif ptype == DISCONNECT:
+                    break
+
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            self.sessions.discard(session)
+            for pattern in list(session.subscriptions):
+                self._unsubscribe(session, pattern)
+            writer.close()
+
+    def _unsubscribe(self, session, pattern):
+        session.subscriptions.discard(pattern)
+        index = self._wildcard if _is_wildcard(pattern) else self._exact
+        subscribers = index.get(pattern)
+        if subscribers is not None:
+            subscribers.discard(session)
+            if not subscribers:
+                del index[pattern]
+
+    def _on_publish(self, session, first, body):
+        qos = (first >> 1) & 0x03
+        retain = bool(first & 0x01)
+
+        topic_len = int.from_bytes(body[0:2], "big")
+        topic = body[2:2 + topic_len].decode()
+        pos = 2 + topic_len
+        if qos:
+            packet_id = body[pos:pos + 2]
+            pos += 2
+        payload = body[pos:]
+
+        self.received += 1
+
+        if qos == 1:
+            session.writer.write(_packet(PUBACK << 4, packet_id))
+        elif qos == 2:
+            session.writer.write(_packet(PUBREC << 4, packet_id))
+
+        if retain:
+            if payload:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)
+
+        targets = set(self._exact.get(topic, ()))
+        for pattern, subscribers in self._wildcard.items():
+            if topic_matches(pattern, topic):
+                targets.update(subscribers)
+
+        packet = _publish_packet(topic, payload, retain=False)
+        for other in targets:
+            other.writer.write(packet)
+            self.delivered[other.client_id] += 1
+
+    def _on_subscribe(self, session, body):
+        packet_id = body[:2]
+        pos = 2
+        new_subs = []
+        while pos < len(body):
+            n = int.from_bytes(body[pos:pos + 2], "big")
+            new_subs.append(body[pos + 2:pos + 2 + n].decode())
+            pos += 2 + n + 1  # skip requested QoS byte
+
+        for pattern in new_subs:
+            session.subscriptions.add(pattern)
+            index = self._wildcard if _is_wildcard(pattern) else self._exact
+            index[pattern].add(session)
+        session.writer.write(_packet((SUBACK << 4), packet_id + b"\x00" * len(new_subs)))
+
+        # Retained messages go out right after SUBACK, flagged as retained
+        for topic, payload in self.retained.items():
+            if any(topic_matches(sub, topic) for sub in new_subs):
+                session.writer.write(_publish_packet(topic, payload, retain=True))
+                self.delivered[session.client_id] += 1
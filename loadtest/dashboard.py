@@ -0,0 +1,153 @@
+# loadtest/dashboard.py
+#
+# Concurrent dashboard clients (what static/app.js does, minus the browser):
+# poll /api/state and now and then POST a new setpoint. A separate MQTT
+# monitor watches thermostat/+/state to time setpoint -> state echoes.
+
+import json
+import random
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+import paho.mqtt.client as mqtt
+
+SETPOINT_CHOICES = [v / 2.0 for v in range(32, 50)]  # 16.0 .. 24.5
+
+# A setpoint not echoed within this long counts as lost
+ECHO_TIMEOUT = 10.0
+
+
+def percentile(values, pct):
+    """None unless there are enough samples for pct to differ from the max."""
+    if not values or (pct < 100 and len(values) < 100.0 / (100 - pct)):
+        return None
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+class RoundTripMonitor:
+    """Times POST /setpoint until the node reports that setpoint in its state."""
+
+    def __init__(self, broker_host, broker_port):
+        self.latencies = []
+        self.lost = 0
+        # thermo_id -> {setpoint: sent_at}; setpoints in flight for one
+        # thermostat are kept distinct, so each key is one request
+        self._pending = defaultdict(dict)
+        self._reported = {}  # thermo_id -> setpoint in its latest state
+        self._lock = threading.Lock()
+
+        self.client = mqtt.Client(client_id="loadtest-monitor")
+        self.client.on_connect = lambda c, u, f, rc: c.subscribe("thermostat/+/state")
+        self.client.on_message = self._on_message
+        self.client.connect(broker_host, broker_port, 60)
+        self.client.loop_start()
+
+    def expect(self, thermo_id, rng, current=None):
+        """
+        Pick a setpoint for thermo_id and start timing it. The value differs
+        from what the node reports now (and from current, the dashboard's
+        view) and from every request still in flight, so only the echo of
+        this request can match it. None if no value is free.
+        """
+        with self._lock:
+            now = time.perf_counter()
+            pending = self._pending[thermo_id]
+            for value, sent_at in list(pending.items()):
+                if now - sent_at > ECHO_TIMEOUT:
+                    del pending[value]
+                    self.lost += 1
+
+            taken = set(pending) | {self._reported.get(thermo_id), current}
+            free = [v for v in SETPOINT_CHOICES if v not in taken]
+            if not free:
+                return None
+            value = rng.choice(free)
+            pending[value] = now
+            return value
+
+    def _on_message(self, client, userdata, msg):
+        thermo_id = msg.topic.split("/")[1]
+        try:
+            setpoint = float(json.loads(msg.payload).get("setpoint"))
+        except (ValueError, TypeError, AttributeError):
+            return
+        with self._lock:
+            self._reported[thermo_id] = setpoint
+            sent_at = self._pending[thermo_id].pop(setpoint, None)
+            if sent_at is not None:
+                self.latencies.append(time.perf_counter() - sent_at)
+
+    def stop(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+
+class DashboardClients:
+    def __init__(self, base_url, count, thermo_ids, monitor=None,
+                 poll_interval=0.75, setpoint_every=2):
+        self.base_url = base_url.rstrip("/")
+        self.count = count
+        self.thermo_ids = list(thermo_ids)
+        self.monitor = monitor
+        self.poll_interval = poll_interval
+        self.setpoint_every = setpoint_every
+
+        self.state_latencies = []
+        self.setpoint_latencies = []
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for n in range(self.count):
+            t = threading.Thread(target=self._run, args=(n,), name=f"dash-{n}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout=10)
+
+    def _request(self, url, data=None):
+        t0 = time.perf_counter()
+        with urllib.request.urlopen(url, data=data, timeout=10) as res:
+            body = res.read()
+        return time.perf_counter() - t0, body
+
+    def _run(self, n):
+        rng = random.Random(n)
+        tick = 0
+
+        while not self._stop.is_set():
+            try:
+                elapsed, state = self._request(f"{self.base_url}/api/state")
+                with self._lock:
+                    self.state_latencies.append(elapsed)
+
+                tick += 1
+                if self.setpoint_every and tick % self.setpoint_every == 0:
+                    tid = rng.choice(self.thermo_ids)
+                    current = (json.loads(state).get(tid) or {}).get("setpoint")
+                    if self.monitor:
+                        value = self.monitor.expect(tid, rng, current)
+                    else:
+                        value = rng.choice([v for v in SETPOINT_CHOICES if v != current])
+                    if value is not None:
+                        body = urllib.parse.urlencode({"setpoint": f"{value:.1f}"}).encode()
+                        elapsed, _ = self._request(
+                            f"{self.base_url}/thermostat/{urllib.parse.quote(tid)}/setpoint", body
+                        )
+                        with self._lock:
+                            self.setpoint_latencies.append(elapsed)
+            except (OSError, ValueError):
+                with self._lock:
+                    self.errors += 1
+
+            self._stop.wait(self.poll_interval)
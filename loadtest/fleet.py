@@ -0,0 +1,163 @@
+# loadtest/fleet.py
+#
+# Simulated thermostat nodes. Each node speaks the same topics as
+# thermostat/thermostat_node.py:
+#   publishes thermostat/<id>/temperature  {"temperature": ...}
+#   publishes thermostat/<id>/state        {"setpoint": ..., "heating": ...}
+#   listens on thermostat/<id>/setpoint and thermostat/<id>/settings
+#
+# Nodes are spread over a handful of MQTT connections so 1000 thermostats
+# don't need 1000 sockets and 1000 paho threads.
+#
+# Unlike the real node, a simulated node echoes its state as soon as a new
+# setpoint arrives, so round-trip numbers measure the broker/bridge path
+# rather than the node's 5 s loop.
+
+import json
+import random
+import threading
+import time
+import paho.mqtt.client as mqtt
+
+
+class SimulatedThermostat:
+    def __init__(self, thermo_id, setpoint=21.0, hysteresis=0.5):
+        self.id = thermo_id
+        self.setpoint = setpoint
+        self.hysteresis = hysteresis
+        self.heating = False
+        self.temperature = setpoint + random.uniform(-2.0, 2.0)
+
+    def step(self):
+        # Crude room model: warm up while heating, drift down otherwise
+        self.temperature += (0.05 if self.heating else -0.03) + random.uniform(-0.02, 0.02)
+
+        if not self.heating and self.temperature < self.setpoint - self.hysteresis:
+            self.heating = True
+        elif self.heating and self.temperature > self.setpoint + self.hysteresis:
+            self.heating = False
+
+    def state_payload(self):
+        return json.dumps({"setpoint": self.setpoint, "heating": self.heating})
+
+    def temperature_payload(self):
+        return json.dumps({"temperature": round(self.temperature, 2)})
+
+
+class SimulatedFleet:
+    def __init__(self, broker_host, broker_port, count, interval=5.0, max_connections=50):
+        self.broker_host = broker_host
+        self.broker_port = broker_port
+        self.interval = float(interval)
+
+        self.thermostats = {
+            f"sim{i:04d}": SimulatedThermostat(f"sim{i:04d}") for i in range(count)
+        }
+
+        n_conns = max(1, min(count, max_connections))
+        self.clients = []
+        self._client_for = {}
+        ids = list(self.thermostats)
+        for k in range(n_conns):
+            client = mqtt.Client(client_id=f"loadtest-node-{k}")
+            client.max_inflight_messages_set(1000)
+            client.on_connect = self._on_connect
+            client.on_message = self._on_message
+            client.user_data_set(ids[k::n_conns])
+            for tid in ids[k::n_conns]:
+                self._client_for[tid] = client
+            self.clients.append(client)
+
+        self.published = 0
+        self._count_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._paused = threading.Event()
+        self._thread = None
+
+    # ---------------- lifecycle ----------------
+
+    def start(self):
+        for client in self.clients:
+            client.connect(self.broker_host, self.broker_port, 60)
+            client.loop_start()
+
+        self._thread = threading.Thread(target=self._run, name="sim-fleet", daemon=True)
+        self._thread.start()
+        return self
+
+    def pause(self):
+        """Stop the periodic publishes (setpoint echoes still go out)."""
+        self._paused.set()
+
+    def resume(self):
+        self._paused.clear()
+
+    def clear_retained(self):
+        """Remove the retained setpoint/settings the run left on the broker."""
+        infos = []
+        for tid, client in self._client_for.items():
+            for leaf in ("setpoint", "settings"):
+                infos.append(client.publish(f"thermostat/{tid}/{leaf}", b"", qos=1, retain=True))
+        for info in infos:
+            info.wait_for_publish(5)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 5)
+        for client in self.clients:
+            client.disconnect()
+            client.loop_stop()
+
+    # ---------------- mqtt ----------------
+
+    def _on_connect(self, client, ids, flags, rc):
+        topics = []
+        for tid in ids:
+            topics.append((f"thermostat/{tid}/setpoint", 1))
+            topics.append((f"thermostat/{tid}/settings", 1))
+        client.subscribe(topics)
+
+    def _on_message(self, client, ids, msg):
+        parts = msg.topic.split("/")
+        thermo = self.thermostats.get(parts[1]) if len(parts) == 3 else None
+        if thermo is None:
+            return
+
+        try:
+            if parts[2] == "setpoint":
+                thermo.setpoint = float(msg.payload.decode())
+                self._publish(thermo.id, "state", thermo.state_payload())
+            elif parts[2] == "settings":
+                data = json.loads(msg.payload)
+                thermo.hysteresis = float(data.get("hysteresis", thermo.hysteresis))
+        except (ValueError, AttributeError):
+            pass
+
+    def _publish(self, thermo_id, leaf, payload):
+        self._client_for[thermo_id].publish(f"thermostat/{thermo_id}/{leaf}", payload, qos=1)
+        with self._count_lock:
+            self.published += 1
+
+    def _run(self):
+        # Spread each tick's publishes over the interval instead of bursting
+        ids = list(self.thermostats)
+        gap = self.interval / len(ids)
+        next_at = time.monotonic()
+
+        while not self._stop.is_set():
+            for tid in ids:
+                while self._paused.is_set():
+                    if self._stop.wait(0.05):
+                        return
+                    next_at = time.monotonic()
+
+                thermo = self.thermostats[tid]
+                thermo.step()
+                self._publish(tid, "temperature", thermo.temperature_payload())
+                self._publish(tid, "state", thermo.state_payload())
+
+                next_at += gap
+                delay = next_at - time.monotonic()
+                if delay > 0 and self._stop.wait(delay):
+                    return
@@ -0,0 +1,62 @@
+# loadtest/server.py
+#
+# Runs the real dashboard (app.create_app + MqttBridge) in its own process
+# so its CPU and memory can be measured apart from the load generators.
+#
+#   python -m loadtest.server --broker-port 1883 --port 5001 \
+#       --snapshot /tmp/s.json --db /tmp/thermo.db
+#
+# The bridge uses its own client id so it never kicks a live dashboard off
+# the broker, and the app gets its own database instead of instance/thermo.db.
+
+import argparse
+import logging
+import os
+import signal
+import sys
+from werkzeug.serving import make_server
+
+from app import create_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard server for load tests")
+    parser.add_argument("--broker-host", default="127.0.0.1")
+    parser.add_argument("--broker-port", type=int, default=1883)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--client-id", default="loadtest-dashboard")
+    parser.add_argument("--snapshot", required=True,
+                        help="bridge snapshot file (the caller owns and removes it)")
+    parser.add_argument("--db", required=True,
+                        help="sqlite database file (the caller owns and removes it)")
+    parser.add_argument("--no-fleet-publish", action="store_true",
+                        help="don't publish thermostat/_fleet/* (shared brokers)")
+    args = parser.parse_args()
+
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.abspath(args.db),
+        "MQTT_BROKER_IP": args.broker_host,
+        "MQTT_BROKER_PORT": args.broker_port,
+        "MQTT_CLIENT_ID": args.client_id,
+        "FLEET_PUBLISH": not args.no_fleet_publish,
+        "SCHEDULER_ENABLED": False,
+        "BRIDGE_SNAPSHOT_PATH": args.snapshot,
+    })
+
+    # terminate() from the runner sends SIGTERM; exit through the finally below
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    # Per-request access logs would dominate the measurement
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    server = make_server(args.host, args.port, app, threaded=True)
+    print(f"Load test dashboard on http://{args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        app.extensions["mqtt_bridge"].stop()
+
+
+if __name__ == "__main__":
+    main()
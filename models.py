@@ -1,12 +1,21 @@
+import re
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
 from datetime import datetime
 
 db = SQLAlchemy()
 
+group_members = db.Table(
+    'thermostat_group_member',
+    db.Column('group_id', db.Integer, db.ForeignKey('thermostat_group.id'), primary_key=True),
+    db.Column('thermostat_id', db.Integer, db.ForeignKey('thermostat.id'), primary_key=True),
+)
+
 class Thermostat(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(64), nullable=False)
     location = db.Column(db.String(64), nullable=True)
+    mqtt_id = db.Column(db.String(64), unique=True, nullable=True)  # thermostat/<mqtt_id>/...
 
     # control state
     current_setpoint = db.Column(db.Float, default=20.0)
@@ -22,6 +31,16 @@ class Thermostat(db.Model):
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class ThermostatGroup(db.Model):
+    """
+    Named set of thermostats for bulk commands. A "zone" is a group with the
+    extra rule that a thermostat is in at most one zone; plain groups overlap.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), unique=True, nullable=False)
+    kind = db.Column(db.String(16), default="group")  # "group" | "zone"
+    thermostats = db.relationship('Thermostat', secondary=group_members, backref='groups')
+
 class Reading(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     thermostat_id = db.Column(db.Integer, db.ForeignKey('thermostat.id'), nullable=False)
@@ -38,3 +57,80 @@ class Schedule(db.Model):
     time_m = db.Column(db.Integer, nullable=False)  # 0..59
     setpoint = db.Column(db.Float, nullable=False)
     enabled = db.Column(db.Boolean, default=True)
+
+class ThermalModel(db.Model):
+    """
+    Per-room first-order thermal model, one row per thermostat:
+        dT/dt = (eq - T) / tau      (tau in hours, eq in °C)
+    fitted separately with the heat on and off. The raw least-squares sums
+    are kept so the nightly refit only has to read new readings.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    thermostat_id = db.Column(db.Integer, db.ForeignKey('thermostat.id'), nullable=False, unique=True)
+
+    # fitted parameters (None until there is enough data)
+    tau_heat = db.Column(db.Float, nullable=True)   # hours
+    eq_heat = db.Column(db.Float, nullable=True)    # °C the room tends to with heat on
+    tau_cool = db.Column(db.Float, nullable=True)   # hours
+    eq_cool = db.Column(db.Float, nullable=True)    # °C the room tends to with heat off
+
+    # sufficient statistics for y = dT/dt against x = T
+    heat_n = db.Column(db.Float, default=0.0)
+    heat_sx = db.Column(db.Float, default=0.0)
+    heat_sxx = db.Column(db.Float, default=0.0)
+    heat_sy = db.Column(db.Float, default=0.0)
+    heat_sxy = db.Column(db.Float, default=0.0)
+    cool_n = db.Column(db.Float, default=0.0)
+    cool_sx = db.Column(db.Float, default=0.0)
+    cool_sxx = db.Column(db.Float, default=0.0)
+    cool_sy = db.Column(db.Float, default=0.0)
+    cool_sxy = db.Column(db.Float, default=0.0)
+
+    last_reading_id = db.Column(db.Integer, default=0)
+    fitted_at = db.Column(db.DateTime, nullable=True)
+
+
+def upgrade_schema():
+    """
+    Bring an existing database up to date without touching its data:
+    create tables that don't exist yet and add columns introduced since.
+    Safe to run on every start. Call inside an app context.
+    """
+    db.create_all()  # only creates missing tables
+
+    columns = {c["name"] for c in inspect(db.engine).get_columns("thermostat")}
+    if "mqtt_id" not in columns:
+        with db.engine.begin() as conn:
+            # SQLite can't ADD COLUMN ... UNIQUE, so uniqueness comes from an index
+            conn.execute(text("ALTER TABLE thermostat ADD COLUMN mqtt_id VARCHAR(64)"))
+            conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS ix_thermostat_mqtt_id ON thermostat (mqtt_id)"
+            ))
+
+    backfill_mqtt_ids()
+
+
+def default_mqtt_id(name):
+    """The id schema_init.py uses for a name: "Living Room" -> "livingroom"."""
+    return re.sub(r"[^a-z0-9]", "", (name or "").lower()) or None
+
+
+def backfill_mqtt_ids():
+    """
+    Give rows without an mqtt_id the default one for their name, so readings,
+    schedules and groups work after an upgrade. Rows whose default is missing,
+    taken or shared with another row are left alone and reported.
+    """
+    missing = Thermostat.query.filter(Thermostat.mqtt_id.is_(None)).all()
+    if not missing:
+        return
+
+    taken = {t.mqtt_id for t in Thermostat.query.filter(Thermostat.mqtt_id.isnot(None))}
+    wanted = [default_mqtt_id(t.name) for t in missing]
+    for thermo, mqtt_id in zip(missing, wanted):
+        if mqtt_id and mqtt_id not in taken and wanted.count(mqtt_id) == 1:
+            thermo.mqtt_id = mqtt_id
+            print(f"Thermostat {thermo.name!r} linked to thermostat/{mqtt_id}/...")
+        else:
+            print(f"Thermostat {thermo.name!r} has no mqtt_id; set it to link its MQTT topics")
+    db.session.commit()
@@ -1,9 +1,34 @@
 # mqtt_bridge.py
+import hashlib
 import json
+import os
+import threading
+import time
 import paho.mqtt.client as mqtt
 from collections import defaultdict
 
 BROKER_IP = "192.168.4.195"
+BROKER_PORT = 1883
+
+# Reconnect backoff (seconds). paho doubles the delay on each failed attempt.
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+
+# How often the in-memory state is written to disk (seconds)
+SNAPSHOT_INTERVAL = 30
+
+# QoS 1 messages allowed on the wire before PUBACKs come back. paho's
+# default (20) serializes bulk fan-out into many broker round-trips.
+MAX_INFLIGHT = 500
+
+# Fleet snapshot: one retained message with every thermostat's last known
+# values, so a new consumer is up to date from a single message instead of
+# waiting for several retained topics per thermostat. Changes in between
+# go out as (non-retained) deltas.
+FLEET_SNAPSHOT_TOPIC = "thermostat/_fleet/snapshot"
+FLEET_DELTA_TOPIC = "thermostat/_fleet/delta"
+FLEET_DEBOUNCE = 1.0            # seconds between delta flushes
+FLEET_SNAPSHOT_INTERVAL = 5.0   # min seconds between retained snapshots
 
 # Add more later, e.g. ["livingroom", "bedroom"]
 THERMOSTATS = ["livingroom"]
@@ -25,32 +50,282 @@ def _deepcopy_json(obj):
     return json.loads(json.dumps(obj))
 
 
+def settings_hash(settings) -> str:
+    # Short, order-independent fingerprint so consumers can tell when
+    # settings changed without carrying them in the fleet snapshot
+    raw = json.dumps(settings, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(raw.encode()).hexdigest()[:8]
+
+
+def _empty_entry():
+    return {
+        "temperature": None,
+        "setpoint": None,
+        "heating": False,
+        "settings": _deepcopy_json(DEFAULT_SETTINGS),
+        "last_seen": None,  # epoch seconds of the last temperature/state message
+        # True while the values came from the on-disk snapshot and
+        # the thermostat hasn't reported since boot
+        "stale": False,
+    }
+
+
 class MqttBridge:
-    def __init__(self):
-        # state[thermo_id] = {temperature, setpoint, heating, settings}
-        self.state = defaultdict(
-            lambda: {
-                "temperature": None,
-                "setpoint": None,
-                "heating": False,
-                "settings": _deepcopy_json(DEFAULT_SETTINGS),
-            }
-        )
+    def __init__(self, broker_ip=BROKER_IP, broker_port=BROKER_PORT, snapshot_path=None,
+                 publish_fleet=True, client_id="flask-dashboard"):
+        # state[thermo_id] = {temperature, setpoint, heating, settings, last_seen, stale}
+        self.state = defaultdict(_empty_entry)
+        self._lock = threading.Lock()
+        self._dirty = False
+
+        # Compact per-thermostat view published on FLEET_SNAPSHOT_TOPIC:
+        #   {"t": temperature, "sp": setpoint, "h": 0/1, "sh": settings hash, "ls": last seen}
+        # Only the bridge that owns the fleet topics publishes (publish_fleet);
+        # secondary bridges just consume the snapshot and deltas.
+        self.publish_fleet = publish_fleet
+        self._fleet = {}
+        self._fleet_changes = {}
+        self._fleet_seq = 0
+        self._fleet_thread = None
+
+        self.broker_ip = broker_ip
+        self.broker_port = broker_port
+        self.snapshot_path = snapshot_path
+        self.connected = False
 
-        self.client = mqtt.Client(client_id="flask-dashboard")
+        self._stop = threading.Event()
+        self._snapshot_thread = None
+        self._started = False
+
+        self.client = mqtt.Client(client_id=client_id)
         self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
         self.client.on_message = self.on_message
-        self.client.connect(BROKER_IP, 1883, 60)
+        self.client.reconnect_delay_set(
+            min_delay=RECONNECT_MIN_DELAY, max_delay=RECONNECT_MAX_DELAY
+        )
+        self.client.max_inflight_messages_set(MAX_INFLIGHT)
+
+        # Warm start: show the last known picture until MQTT catches up
+        self.load_snapshot()
+
+    def start(self):
+        """
+        Connect in the background. Never blocks: connect_async only records
+        the broker, and paho's network thread does the actual connect and
+        keeps retrying with exponential backoff if the broker is down.
+        """
+        if self._started:
+            return
+        self._started = True
+
+        self.client.connect_async(self.broker_ip, self.broker_port, 60)
         self.client.loop_start()
 
+        if self.snapshot_path:
+            self._snapshot_thread = threading.Thread(
+                target=self._snapshot_loop, name="bridge-snapshot", daemon=True
+            )
+            self._snapshot_thread.start()
+
+        if self.publish_fleet:
+            self._fleet_thread = threading.Thread(
+                target=self._fleet_loop, name="bridge-fleet", daemon=True
+            )
+            self._fleet_thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._started:
+            self.client.disconnect()
+            self.client.loop_stop()
+        self.save_snapshot()
+
     def on_connect(self, client, userdata, flags, rc):
         print("Flask connected to MQTT, rc =", rc)
+        self.connected = rc == 0
 
         # Wildcard so new thermostats just work
         client.subscribe("thermostat/+/temperature")
         client.subscribe("thermostat/+/state")
         client.subscribe("thermostat/+/settings")
 
+        # The retained snapshot gives a full picture right away. The publishing
+        # bridge only needs it once at boot; consumers follow the deltas too.
+        client.subscribe(FLEET_SNAPSHOT_TOPIC)
+        if not self.publish_fleet:
+            client.subscribe(FLEET_DELTA_TOPIC)
+
+    def on_disconnect(self, client, userdata, rc):
+        # paho's loop thread reconnects on its own (with backoff)
+        print("Flask disconnected from MQTT, rc =", rc)
+        self.connected = False
+
+    # ---------------- snapshot ----------------
+
+    def load_snapshot(self):
+        """
+        Seed state from the last snapshot on disk. Every entry is marked
+        stale until its thermostat reports again.
+        """
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+
+        try:
+            with open(self.snapshot_path, "r") as f:
+                data = json.load(f)
+        except Exception as e:
+            print("Ignoring unreadable bridge snapshot:", e)
+            return
+
+        if not isinstance(data, dict):
+            return
+
+        with self._lock:
+            for thermo_id, saved in data.items():
+                if not isinstance(saved, dict):
+                    continue
+                entry = self.state[thermo_id]
+                entry["temperature"] = saved.get("temperature")
+                entry["setpoint"] = saved.get("setpoint")
+                entry["heating"] = bool(saved.get("heating"))
+                entry["settings"] = self._merge_settings(saved.get("settings"))
+                entry["last_seen"] = saved.get("last_seen")
+                entry["stale"] = True
+                self._fleet_refresh(thermo_id)
+
+    def save_snapshot(self):
+        """Write state to disk if it changed since the last save."""
+        if not self.snapshot_path:
+            return
+
+        with self._lock:
+            if not self._dirty:
+                return
+            payload = json.dumps(self.state)
+            self._dirty = False
+
+        # Write-then-rename so a crash never leaves a half-written file
+        tmp_path = self.snapshot_path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+            with open(tmp_path, "w") as f:
+                f.write(payload)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            print("Could not write bridge snapshot:", e)
+            with self._lock:
+                self._dirty = True
+
+    def _snapshot_loop(self):
+        while not self._stop.wait(SNAPSHOT_INTERVAL):
+            self.save_snapshot()
+
+    # ---------------- fleet snapshot ----------------
+
+    def _fleet_refresh(self, thermo_id):
+        """Recompute one compact fleet entry and note what changed. Hold _lock."""
+        entry = self.state[thermo_id]
+        compact = {
+            "t": entry["temperature"],
+            "sp": entry["setpoint"],
+            "h": 1 if entry["heating"] else 0,
+            "sh": settings_hash(entry["settings"]),
+            "ls": entry["last_seen"],
+            "st": 1 if entry["stale"] else 0,
+        }
+        old = self._fleet.get(thermo_id, {})
+        changed = {k: v for k, v in compact.items() if old.get(k) != v}
+        if changed:
+            # Always send "st": a receiver must never guess whether values are live
+            changed["st"] = compact["st"]
+            self._fleet[thermo_id] = compact
+            self._fleet_changes.setdefault(thermo_id, {}).update(changed)
+
+    def _apply_fleet_entries(self, entries, live):
+        """
+        Take values from a fleet snapshot/delta where they are newer than ours.
+        live: True for deltas received while connected. Values from the
+        retained snapshot may be from a previous run, so they stay stale
+        until the thermostat itself (or a live delta) reports. A delta keeps
+        the sender's "st" flag, so values the sender only loaded from disk
+        stay stale here too.
+        """
+        if not isinstance(entries, dict):
+            return
+
+        with self._lock:
+            for thermo_id, e in entries.items():
+                if not isinstance(e, dict) or e.get("ls") is None:
+                    continue
+                entry = self.state[thermo_id]
+                if entry["last_seen"] is not None and entry["last_seen"] >= e["ls"]:
+                    continue
+
+                if "t" in e:
+                    entry["temperature"] = e["t"]
+                if "sp" in e:
+                    entry["setpoint"] = e["sp"]
+                if "h" in e:
+                    entry["heating"] = bool(e["h"])
+                entry["last_seen"] = e["ls"]
+                entry["stale"] = not live or bool(e.get("st"))
+                self._fleet_refresh(thermo_id)
+            self._dirty = True
+
+    def _on_fleet_message(self, topic, data):
+        if not isinstance(data, dict):
+            return
+
+        if topic == FLEET_SNAPSHOT_TOPIC:
+            self._apply_fleet_entries(data.get("thermostats"), live=False)
+            if self.publish_fleet:
+                # Continue the sequence of whoever published it; from here on
+                # our own state is authoritative
+                with self._lock:
+                    self._fleet_seq = max(self._fleet_seq, int(data.get("seq", 0)))
+                self.client.unsubscribe(FLEET_SNAPSHOT_TOPIC)
+
+        elif topic == FLEET_DELTA_TOPIC and not self.publish_fleet:
+            # No ordering needed: entries only apply if their "ls" is newer
+            self._apply_fleet_entries(data.get("changes"), live=True)
+
+    def publish_fleet_snapshot(self):
+        with self._lock:
+            payload = json.dumps(
+                {"seq": self._fleet_seq, "ts": round(time.time(), 1), "thermostats": self._fleet},
+                separators=(",", ":"),
+            )
+        self.client.publish(FLEET_SNAPSHOT_TOPIC, payload, qos=1, retain=True)
+
+    def _fleet_loop(self):
+        """
+        Debounce: changes collected between ticks go out as one delta, and
+        the retained snapshot is rebuilt at most every FLEET_SNAPSHOT_INTERVAL.
+        """
+        last_snapshot = 0.0
+        snapshot_due = False
+
+        while not self._stop.wait(FLEET_DEBOUNCE):
+            with self._lock:
+                changes, self._fleet_changes = self._fleet_changes, {}
+                if changes:
+                    self._fleet_seq += 1
+                    seq = self._fleet_seq
+
+            if changes:
+                snapshot_due = True
+                self.client.publish(
+                    FLEET_DELTA_TOPIC,
+                    json.dumps({"seq": seq, "changes": changes}, separators=(",", ":")),
+                    qos=0,
+                )
+
+            if snapshot_due and self.connected and time.monotonic() - last_snapshot >= FLEET_SNAPSHOT_INTERVAL:
+                self.publish_fleet_snapshot()
+                last_snapshot = time.monotonic()
+                snapshot_due = False
+
     def _topic_thermo_id(self, topic: str):
         # expected: thermostat/<id>/<leaf>
         parts = topic.split("/")
@@ -80,37 +355,53 @@ class MqttBridge:
         return merged
 
     def on_message(self, client, userdata, msg):
+        if msg.topic in (FLEET_SNAPSHOT_TOPIC, FLEET_DELTA_TOPIC):
+            try:
+                self._on_fleet_message(msg.topic, json.loads(msg.payload))
+            except Exception:
+                pass
+            return
+
         thermo_id = self._topic_thermo_id(msg.topic)
         if not thermo_id:
             return
 
         leaf = msg.topic.split("/")[-1]
 
-        if leaf == "temperature":
-            try:
-                payload = json.loads(msg.payload)
-                self.state[thermo_id]["temperature"] = payload.get("temperature")
-            except Exception:
-                pass
+        try:
+            data = json.loads(msg.payload)
+        except Exception:
+            return
 
-        elif leaf == "state":
-            try:
-                data = json.loads(msg.payload)
-                self.state[thermo_id]["setpoint"] = data.get("setpoint")
-                self.state[thermo_id]["heating"] = bool(data.get("heating"))
-            except Exception:
-                pass
+        with self._lock:
+            entry = self.state[thermo_id]
 
-        elif leaf == "settings":
-            # Retained settings come back here after publish or reconnect
-            try:
-                data = json.loads(msg.payload)
-                self.state[thermo_id]["settings"] = self._merge_settings(data)
-            except Exception:
-                pass
+            if leaf == "temperature":
+                try:
+                    entry["temperature"] = data.get("temperature")
+                    entry["last_seen"] = round(time.time(), 1)
+                    entry["stale"] = False
+                except Exception:
+                    pass
+
+            elif leaf == "state":
+                try:
+                    entry["setpoint"] = data.get("setpoint")
+                    entry["heating"] = bool(data.get("heating"))
+                    entry["last_seen"] = round(time.time(), 1)
+                    entry["stale"] = False
+                except Exception:
+                    pass
+
+            elif leaf == "settings":
+                # Retained settings come back here after publish or reconnect
+                entry["settings"] = self._merge_settings(data)
+
+            self._fleet_refresh(thermo_id)
+            self._dirty = True
 
     def publish_setpoint(self, thermo_id: str, value: float):
-        self.client.publish(
+        return self.client.publish(
             f"thermostat/{thermo_id}/setpoint",
             float(value),
             qos=1,
@@ -127,23 +418,49 @@ class MqttBridge:
         """
         try:
             # Update local cache immediately (merged with defaults)
-            self.state[thermo_id]["settings"] = self._merge_settings(settings)
+            with self._lock:
+                self.state[thermo_id]["settings"] = self._merge_settings(settings)
+                self._fleet_refresh(thermo_id)
+                self._dirty = True
         except Exception:
             # Don't block publishing if cache update fails
             pass
 
         # Publish retained settings
-        self.client.publish(
+        return self.client.publish(
             f"thermostat/{thermo_id}/settings",
             json.dumps(settings),
             qos=1,
             retain=True,
         )
 
+    def wait_for_acks(self, infos, timeout: float):
+        """
+        Wait (up to timeout in total) for PUBACKs of messages already handed
+        to paho, then report each one as "acked", "pending" (no ACK yet),
+        "queued" (not connected; paho sends it after reconnect) or "error".
+        """
+        deadline = time.monotonic() + timeout
+        statuses = []
+        for info in infos:
+            if info.rc == mqtt.MQTT_ERR_NO_CONN:
+                statuses.append("queued")
+                continue
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                statuses.append("error")
+                continue
+
+            remaining = deadline - time.monotonic()
+            if remaining > 0 and not info.is_published():
+                info.wait_for_publish(remaining)
+            statuses.append("acked" if info.is_published() else "pending")
+        return statuses
+
     def get_dashboard_state(self):
         # Ensure a stable set of ids even before MQTT messages arrive
-        ids = list(self.state.keys()) or THERMOSTATS
-        return {tid: self.state[tid] for tid in ids}
+        with self._lock:
+            ids = list(self.state.keys()) or THERMOSTATS
+            return {tid: dict(self.state[tid]) for tid in ids}
 
     def get_thermostat(self, thermo_id: str):
         return self.state[thermo_id]
@@ -0,0 +1,131 @@
+# scheduler.py
+#
+# Background jobs for the dashboard (APScheduler):
+#   - record a Reading per thermostat every minute (history for analytics)
+#   - apply Schedule setpoints, starting early when the room needs time
+#     to heat up (optimal start, see analytics.preheat_minutes)
+#   - refit the thermal models once a night
+
+import time
+from datetime import datetime, timedelta, time as dtime
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy.exc import SQLAlchemyError
+
+from analytics import preheat_minutes, refit_thermal_models
+from models import db, Reading, Schedule, Thermostat, ThermalModel
+
+TICK_SECONDS = 60
+REFIT_HOUR = 3  # local time
+
+# A thermostat that hasn't reported for this long is offline: its last value
+# is neither recorded (a flat line for the thermal model) nor used for preheat
+READING_MAX_AGE = 2 * TICK_SECONDS
+
+# A schedule whose time passed this recently still counts as upcoming, so a
+# late tick doesn't skip it
+GRACE = timedelta(minutes=2)
+
+
+def next_occurrence(schedule, after: datetime):
+    """First local datetime >= after matching the schedule's weekday mask (bit 0 = Monday)."""
+    at = dtime(schedule.time_h, schedule.time_m)
+    for offset in range(8):
+        day = after.date() + timedelta(days=offset)
+        if not schedule.weekday_mask & (1 << day.weekday()):
+            continue
+        candidate = datetime.combine(day, at)
+        if candidate >= after:
+            return candidate
+    return None
+
+
+def is_fresh(entry, now=None):
+    """True if a bridge state entry holds a live report from the last READING_MAX_AGE."""
+    if not entry or entry.get("stale") or entry.get("last_seen") is None:
+        return False
+    return entry["last_seen"] >= (now or time.time()) - READING_MAX_AGE
+
+
+class ThermostatScheduler:
+    def __init__(self, app, bridge):
+        self.app = app
+        self.bridge = bridge
+        # schedule.id -> occurrence already sent, so each one goes out once
+        self._applied = {}
+        self._scheduler = BackgroundScheduler(daemon=True)
+
+    def start(self):
+        self._scheduler.add_job(self._in_app(self.record_readings), "interval", seconds=TICK_SECONDS)
+        self._scheduler.add_job(self._in_app(self.apply_schedules), "interval", seconds=TICK_SECONDS)
+        self._scheduler.add_job(self._in_app(refit_thermal_models), "cron", hour=REFIT_HOUR)
+        self._scheduler.start()
+
+    def stop(self):
+        self._scheduler.shutdown(wait=False)
+
+    def _in_app(self, fn):
+        def run():
+            with self.app.app_context():
+                try:
+                    fn()
+                except SQLAlchemyError as e:
+                    # e.g. schema not upgraded yet: skip this tick, try again next one
+                    db.session.rollback()
+                    print(f"{fn.__name__} skipped, database error:", e)
+        return run
+
+    def record_readings(self):
+        state = self.bridge.get_dashboard_state()
+
+        for thermo in Thermostat.query.filter(Thermostat.mqtt_id.isnot(None)):
+            entry = state.get(thermo.mqtt_id)
+            # Only record what the thermostat actually reported, recently
+            if not is_fresh(entry):
+                continue
+            if entry.get("temperature") is None or entry.get("setpoint") is None:
+                continue
+
+            db.session.add(Reading(
+                thermostat_id=thermo.id,
+                temperature=float(entry["temperature"]),
+                setpoint=float(entry["setpoint"]),
+                is_on=bool(entry.get("heating")),
+            ))
+
+        db.session.commit()
+
+    def apply_schedules(self, now=None):
+        now = now or datetime.now()
+        state = self.bridge.get_dashboard_state()
+        models = {m.thermostat_id: m for m in ThermalModel.query.all()}
+
+        # Soonest pending occurrence per thermostat. Only that one may
+        # preheat, so an earlier schedule is never jumped over.
+        upcoming = {}
+        rows = (
+            db.session.query(Schedule, Thermostat)
+            .join(Thermostat, Schedule.thermostat_id == Thermostat.id)
+            .filter(Schedule.enabled.is_(True), Thermostat.mqtt_id.isnot(None))
+        )
+        for sched, thermo in rows:
+            occurrence = next_occurrence(sched, now - GRACE)
+            if occurrence is None or self._applied.get(sched.id) == occurrence:
+                continue
+            best = upcoming.get(thermo.id)
+            if best is None or occurrence < best[0]:
+                upcoming[thermo.id] = (occurrence, sched, thermo)
+
+        for occurrence, sched, thermo in upcoming.values():
+            # An old or snapshot temperature could mean hours of needless
+            # preheat; without a live one the schedule just runs on time
+            entry = state.get(thermo.mqtt_id)
+            temp = entry.get("temperature") if is_fresh(entry) else None
+            lead = preheat_minutes(models.get(thermo.id), temp, sched.setpoint)
+
+            if now >= occurrence - timedelta(minutes=lead):
+                if lead:
+                    print(f"Preheating {thermo.mqtt_id} {lead:.0f} min ahead of "
+                          f"{occurrence:%H:%M} -> {sched.setpoint}")
+                self.bridge.publish_setpoint(thermo.mqtt_id, sched.setpoint)
+                self._applied[sched.id] = occurrence
@@ -1,6 +1,6 @@
 from app import create_app
 from models import db, Thermostat
-app = create_app()
+app = create_app(start_mqtt=False)
 
 with app.app_context():
     db.drop_all()
@@ -9,6 +9,7 @@ with app.app_context():
     if Thermostat.query.count() == 0:
         t1 = Thermostat(
             name="Living Room",
+            mqtt_id="livingroom",
             location="First floor",
             current_setpoint=21.0,
             hysteresis_up=0.5,
@@ -19,6 +20,7 @@ with app.app_context():
         )
         t2 = Thermostat(
             name="Bedroom",
+            mqtt_id="bedroom",
             location="Second floor",
             current_setpoint=19.0,
             hysteresis_up=0.5,
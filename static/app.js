@@ -65,31 +65,70 @@ function clearPending(card) {
   delete card.dataset.pendingSetpoint;
 }
 
+// Per-card view: DOM nodes are looked up once, and the last value written to
+// each is remembered so a tick where nothing changed touches no DOM at all.
+const views = new Map(); // thermo id -> { card, els, last }
+
+function getView(card) {
+  const tid = card.getAttribute("data-thermo-id");
+  let view = views.get(tid);
+  if (!view) {
+    view = {
+      card,
+      els: {
+        temp: card.querySelector('[data-role="temp"]'),
+        setpoint: card.querySelector('[data-role="setpoint"]'), // authoritative
+        heating: card.querySelector('[data-role="heating"]'),
+        status: card.querySelector('[data-role="status"]'),
+        heatPill: card.querySelector('[data-role="heatpill"]'),
+        input: card.querySelector('input[name="setpoint"]'),
+      },
+      last: {},
+    };
+    views.set(tid, view);
+  }
+  return view;
+}
+
+function setText(view, key, text) {
+  const el = view.els[key];
+  if (!el || view.last[key] === text) return;
+  el.textContent = text;
+  view.last[key] = text;
+}
+
+function formatTemp(v) {
+  return (v == null) ? "--.-" : Number(v).toFixed(1);
+}
+
 function updateCard(card, data) {
-  const tempEl = card.querySelector('[data-role="temp"]');
-  const setBubbleEl = card.querySelector('[data-role="setpoint"]'); // authoritative
-  const heatEl = card.querySelector('[data-role="heating"]');
-  const statusEl = card.querySelector('[data-role="status"]');
-  const heatPill = card.querySelector('[data-role="heatpill"]');
-  const input = card.querySelector('input[name="setpoint"]');
+  const view = getView(card);
+  const { els, last } = view;
 
   const temp = data.temperature;
   const sp = data.setpoint;     // authoritative thermostat setpoint
   const heating = !!data.heating;
 
-  if (tempEl) tempEl.textContent = (temp == null) ? "--.-" : Number(temp).toFixed(1);
+  setText(view, "temp", formatTemp(temp));
 
   // Bubble setpoint: ONLY from thermostat feedback
-  if (setBubbleEl) setBubbleEl.textContent = (sp == null) ? "--.-" : Number(sp).toFixed(1);
+  setText(view, "setpoint", formatTemp(sp));
 
-  if (heatEl) heatEl.textContent = heating ? "ON" : "OFF";
-  if (heatPill) heatPill.classList.toggle("on", heating);
+  setText(view, "heating", heating ? "ON" : "OFF");
+  if (els.heatPill && last.heatPill !== heating) {
+    els.heatPill.classList.toggle("on", heating);
+    last.heatPill = heating;
+  }
 
-  // Presets from settings
-  updatePresetButtons(card, data.settings);
+  // Presets from settings (only rebuilt when they change)
+  const presetsKey = JSON.stringify((data.settings && data.settings.presets) || null);
+  if (last.presets !== presetsKey) {
+    updatePresetButtons(card, data.settings);
+    last.presets = presetsKey;
+  }
 
   // Local input init once
-  ensureLocalInitialized(input, sp);
+  ensureLocalInitialized(els.input, sp);
 
   // Pending resolution (only affects status)
   const pending = card.dataset.pendingSetpoint;
@@ -98,34 +137,94 @@ function updateCard(card, data) {
   }
 
   // Status logic
-  if (statusEl) {
-    if (card.dataset.pendingSetpoint != null) {
-      statusEl.textContent = "Pending…";
-    } else {
-      statusEl.textContent = (temp == null && sp == null) ? "Waiting for MQTT…" : "Live";
-    }
+  let status;
+  if (card.dataset.pendingSetpoint != null) {
+    status = "Pending…";
+  } else if (temp == null && sp == null) {
+    status = "Waiting for MQTT…";
+  } else {
+    // stale = last snapshot from disk, thermostat hasn't reported since restart
+    status = data.stale ? "Last known" : "Live";
   }
+  setText(view, "status", status);
+}
+
+// ---------------- polling ----------------
+//
+// - The server answers 304 when /api/state hasn't changed (ETag), so an idle
+//   tick costs one tiny request and no JSON parsing or rendering.
+// - Rendering is batched into one requestAnimationFrame per new state.
+// - Polling stops while the tab is hidden and resumes immediately when it
+//   becomes visible again; errors back off exponentially.
+
+const POLL_MS = 750;
+const MAX_BACKOFF_MS = 10000;
+
+let latestState = null;
+let etag = null;
+let pollTimer = null;
+let polling = false;
+let failures = 0;
+let renderQueued = false;
+
+function renderAll() {
+  renderQueued = false;
+  if (!latestState) return;
+
+  views.forEach((view, tid) => {
+    if (latestState[tid]) updateCard(view.card, latestState[tid]);
+  });
+}
+
+function scheduleRender() {
+  if (renderQueued) return;
+  renderQueued = true;
+  requestAnimationFrame(renderAll);
+}
+
+function schedulePoll() {
+  if (document.hidden || pollTimer || polling) return;
+  const delay = failures ? Math.min(MAX_BACKOFF_MS, POLL_MS * 2 ** failures) : POLL_MS;
+  pollTimer = setTimeout(poll, delay);
 }
 
 async function poll() {
+  pollTimer = null;
+  polling = true;
   try {
-    const res = await fetch("/api/state", { cache: "no-store" });
-    const all = await res.json();
-
-    document.querySelectorAll(".card[data-thermo-id]").forEach(card => {
-      const tid = card.getAttribute("data-thermo-id");
-      if (tid && all[tid]) updateCard(card, all[tid]);
-    });
+    const headers = etag ? { "If-None-Match": etag } : {};
+    const res = await fetch("/api/state", { cache: "no-store", headers });
+
+    if (res.status === 200) {
+      etag = res.headers.get("ETag");
+      latestState = await res.json();
+      scheduleRender();
+    } else if (res.status !== 304) {
+      throw new Error(`HTTP ${res.status}`);
+    }
+    failures = 0;
   } catch (e) {
-    // ignore transient errors
+    // transient errors: back off instead of hammering the server
+    failures++;
   } finally {
-    setTimeout(poll, 750);
+    polling = false;
+    schedulePoll();
   }
 }
 
+document.addEventListener("visibilitychange", () => {
+  if (document.hidden) {
+    clearTimeout(pollTimer);
+    pollTimer = null;
+  } else if (!pollTimer && !polling) {
+    poll(); // catch up right away
+  }
+});
+
 // This is the "fetch thing": it sends a POST without reloading the page.
 async function sendSetpoint(card, thermoId, value) {
   setPending(card, value);
+  scheduleRender(); // show "Pending…" now, not on the next change from the server
 
   const form = new FormData();
   form.set("setpoint", Number(value).toFixed(1));
@@ -138,6 +237,7 @@ async function sendSetpoint(card, thermoId, value) {
   if (!res.ok) {
     // If send failed, clear pending so UI doesn't get stuck.
     clearPending(card);
+    scheduleRender();
   }
 }
 
@@ -147,6 +247,8 @@ function wireControls() {
     const input = card.querySelector('input[name="setpoint"]');
     if (!input || !thermoId) return;
 
+    getView(card);
+
     if (!input.dataset.localInit) input.dataset.localInit = "0";
 
     // Typing: local only